@@ -1,9 +1,52 @@
+import functools
 import math
+import operator as _op
+import string
+import sys
 
 from mcdreforged.api.types import PluginServerInterface
 from mcdreforged.api.command import GreedyText, SimpleCommandBuilder
 
+_DIGITS = frozenset(string.digits)
+_NUMBER_CHARS = frozenset(string.digits + '.')
+_LETTERS = frozenset(string.ascii_letters)
+_OPERATORS = frozenset('+-*/%^')
+
+def _divide(a, b):
+    if abs(b) < 1e-10:
+        raise ValueError("除以零")
+    return a / b
+
+def _modulo(a, b):
+    if abs(b) < 1e-10:
+        raise ValueError("对0取余")
+    return a % b
+
+_MAX_POWER_BITS = 4096
+
+def _power(a, b):
+    if isinstance(a, int) and isinstance(b, int) and abs(a) > 1 and b * math.log2(abs(a)) > _MAX_POWER_BITS:
+        raise ValueError("结果过大")
+    try:
+        result = a ** b
+    except OverflowError:
+        raise ValueError("结果过大")
+    except ZeroDivisionError:
+        raise ValueError("除以零")
+    if isinstance(result, complex):
+        raise ValueError("结果为复数")
+    return result
+
 class Calculator:
+    _BINOPS = {
+        '+': _op.add,
+        '-': _op.sub,
+        '*': _op.mul,
+        '/': _divide,
+        '%': _modulo,
+        '^': _power,
+    }
+
     def __init__(self):
         self.functions = {
             'sin': math.sin,
@@ -55,87 +98,91 @@ class Calculator:
             'opv': 536870912,
             'max': 2147483648,
         }
+        self._prio = {
+            **self.operator,
+            '(': 0,
+            **{u: 4 for u in self.unit},
+            **{f: 5 for f in self.functions},
+        }
 
-    def get_priority(self, op: str) -> int:
-        if op in self.operator:
-            return self.operator[op]
-        elif op == '(':
-            return 0
-        elif op in self.unit:
-            return 4
-        else:
-            return 5
-
-    def calculate(self, number_stack: list, operator_stack: list):
+    def calculate(self, number_stack: list, operator_stack: list) -> None:
         op = operator_stack.pop()
-        if op in self.functions:
-            arg = number_stack.pop()
-            num = self.functions[op](arg)
-            number_stack.append(num)
-        elif op in self.operator:
-            try:
-                b = number_stack.pop()
-                a = number_stack.pop()
-            except:
+        binop = self._BINOPS.get(op)
+        if binop is not None:
+            if len(number_stack) < 2:
                 raise ValueError(f"运算符{op}缺少足够参数")
-            if op == '+':
-                number_stack.append(a + b)
-            elif op == '-':
-                number_stack.append(a - b)
-            elif op == '*':
-                number_stack.append(a * b)
-            elif op == '/':
-                if abs(b) < 1e-10:
-                    raise ValueError("除以零")
-                number_stack.append(a / b)
-            elif op == '%':
-                if abs(b) < 1e-10:
-                    raise ValueError("对0取余")
-                number_stack.append(a % b)
-            elif op == '^':
-                number_stack.append(a ** b)
-        elif op == '(':
+            b = number_stack.pop()
+            number_stack[-1] = binop(number_stack[-1], b)
+            return
+        if op == '(':
             operator_stack.append(op)
-        elif op in self.unit:
-            num = number_stack.pop()
-            num = num * self.unit[op]
-            number_stack.append(num)
+            return
+        if not number_stack:
+            raise ValueError(f'{op}缺少参数')
+        function = self.functions.get(op)
+        if function is not None:
+            number_stack[-1] = function(number_stack[-1])
+            return
+        unit = self.unit.get(op)
+        if unit is not None:
+            number_stack[-1] *= unit
         elif 'max' in op:
-            num = number_stack.pop()
             add = ord(op[3]) - ord('a') + 1
-            num = num * self.unit['max'] * (4 ** add)
-            number_stack.append(num)
+            number_stack[-1] *= self.unit['max'] * (4 ** add)
         else:
             raise ValueError(f'无效的运算: {op}')
-        return number_stack, operator_stack
 
     def expression_parse(self, expr: str) -> float:
         number_stack = []
         operator_stack = []
+        prio = self._prio.get
+        binops = self._BINOPS
         i = 0
         length = len(expr)
         while i < length:
             char = expr[i]
-            if char == '(':
+            if char in _OPERATORS:
+                char_prio = prio(char)
+                while operator_stack:
+                    top = operator_stack[-1]
+                    top_prio = prio(top, 5)
+                    if char_prio > top_prio or (char_prio == top_prio and char == '^'):
+                        break
+                    binop = binops.get(top)
+                    if binop is not None and len(number_stack) > 1:
+                        operator_stack.pop()
+                        b = number_stack.pop()
+                        number_stack[-1] = binop(number_stack[-1], b)
+                    else:
+                        self.calculate(number_stack, operator_stack)
+                operator_stack.append(char)
+            elif char in _DIGITS or char.isdigit():
+                start = i
+                i += 1
+                while i < length and (expr[i] in _NUMBER_CHARS or expr[i].isdigit()):
+                    i += 1
+                number_stack.append(float(expr[start:i]))
+                continue
+            elif char == '(':
                 operator_stack.append(char)
             elif char == ')':
                 while operator_stack and operator_stack[-1] != '(':
-                    number_stack, operator_stack = self.calculate(number_stack, operator_stack)
+                    binop = binops.get(operator_stack[-1])
+                    if binop is not None and len(number_stack) > 1:
+                        operator_stack.pop()
+                        b = number_stack.pop()
+                        number_stack[-1] = binop(number_stack[-1], b)
+                    else:
+                        self.calculate(number_stack, operator_stack)
                 if not operator_stack:
                     raise ValueError('括号不匹配')
                 operator_stack.pop()
-            elif char.isdigit():
-                number = ""
-                while i < length and (expr[i].isdigit() or expr[i] == '.'):
-                    number += expr[i]
-                    i += 1
-                number_stack.append(float(number))
-                continue
-            elif char.isalpha():
-                function_name = ""
-                while i < length and expr[i].isalpha():
-                    function_name += expr[i].lower()
+            elif char in _LETTERS or char.isalpha():
+                start = i
+                i += 1
+                while i < length and (expr[i] in _LETTERS or expr[i].isalpha()):
                     i += 1
+                function_name = sys.intern(expr[start:i])
                 if function_name in self.functions:
                     operator_stack.append(function_name)
                 elif function_name in self.unit or 'max' in function_name:
@@ -143,23 +190,22 @@ class Calculator:
                 else:
                     raise ValueError(f'未知的函数或单位: {function_name}')
                 continue
-            elif char in self.operator:
-                while (operator_stack and (
-                        self.get_priority(char) < self.get_priority(operator_stack[-1]) or (
-                            self.get_priority(char) == self.get_priority(operator_stack[-1]) and
-                            char != '^'
-                        )
-                    )
-                ):
-                    number_stack, operator_stack = self.calculate(number_stack, operator_stack)
-                operator_stack.append(char)
             else:
                 raise ValueError(f'非法字符: {char}')
             i = i + 1
         while operator_stack:
-            if operator_stack[-1] == '(':
+            top = operator_stack[-1]
+            if top == '(':
                 raise ValueError('括号不匹配')
-            number_stack, operator_stack = self.calculate(number_stack, operator_stack)
+            binop = binops.get(top)
+            if binop is not None and len(number_stack) > 1:
+                operator_stack.pop()
+                b = number_stack.pop()
+                number_stack[-1] = binop(number_stack[-1], b)
+            else:
+                self.calculate(number_stack, operator_stack)
+        if not number_stack:
+            raise ValueError('缺少数字')
         result = float(number_stack.pop())
         if number_stack:
             raise ValueError('数字多余')
@@ -170,18 +216,27 @@ class Calculator:
             return "0"
         if abs(value - round(value)) < 1e-10:
             return str(int(round(value)))
-        formatted = f"{value:.10f}"
-        formatted = formatted.rstrip('0').rstrip('.')
-        return formatted
+        return f"{value:.10f}".rstrip('0')
 
     def solve(self, expression: str) -> str:
-        result = self.expression_parse(expression.replace(" ",""))
+        result = self.expression_parse(expression.replace(" ","").lower())
         if math.isinf(result):
             return "Inf" if result > 0 else "-Inf"
         elif math.isnan(result):
             return "Nan"
         return self.format_result(result)
 
+CALCULATOR = Calculator()
+
+@functools.lru_cache(maxsize=256)
+def _cached_solve(expression: str) -> tuple:
+    try:
+        return True, CALCULATOR.solve(expression)
+    except OverflowError:
+        return False, '结果过大'
+    except (ValueError, ArithmeticError) as e:
+        return False, str(e)
+
 def on_load(server: PluginServerInterface, prev_module):
     server.logger.info('loaded MLC Calculator plugin')
     server.register_help_message('!!calc', '查看计算器帮助')
@@ -205,8 +260,8 @@ def say_help_msg(src, ctx):
 
 def calc_expression(src, ctx):
     expression = ctx['expression']
-    calculator = Calculator()
-    try:
-        src.get_server().say(f'§7{expression}=§e{calculator.solve(expression)}')
-    except ValueError as e:
-        src.get_server().say(f'§7{expression}表达式错误: §c{e}')
\ No newline at end of file
+    ok, result = _cached_solve(expression)
+    if ok:
+        src.get_server().say(f'§7{expression}=§e{result}')
+    else:
+        src.get_server().say(f'§7{expression}表达式错误: §c{result}')
\ No newline at end of file